@@ -5,19 +5,102 @@ Exports all Google Docs from a specified folder to CSV format
 """
 
 import os
+import argparse
+import asyncio
 import csv
-import io
-from datetime import datetime
+import functools
+import gzip
+import hashlib
+import importlib.util
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.model import JsonModel
 from google.oauth2 import service_account
-import pandas as pd
+from google_auth_httplib2 import AuthorizedHttp, Request
+import httplib2
 import json
+import queue
+import random
 import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
+# httpx only speaks HTTP/2 with the optional h2 package (httpx[http2]);
+# without it the same clients fall back to pooled HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Drive starts returning 403 userRateLimitExceeded well before this many
+# concurrent exports, so keep the pool small
+MAX_EXPORT_WORKERS = 16
+
+# In-flight exports when downloading with asyncio; the rate limiter still
+# decides how fast new ones start
+MAX_ASYNC_EXPORTS = 64
+DRIVE_EXPORT_URL = 'https://www.googleapis.com/drive/v3/files/{file_id}/export'
+
+# The export thread pool only runs without httpx, and httplib2.Http is not
+# thread-safe, so each worker thread gets its own service
+_thread_local = threading.local()
+
+# httpx connection pools: one for the Drive service, one for async exports
+MAX_HTTP_CONNECTIONS = 32
+HTTP_TIMEOUT_SECONDS = 120
+_http2_client = None
+_http2_client_lock = threading.Lock()
+
+# Stay under Drive's per-user quota instead of bursting into 403 rate limit errors
+REQUESTS_PER_SECOND = 8
+
+# Drive returns these transiently under load; anything else is a real failure
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF_SECONDS = 64
+
+# Drive rejects large batches with HTTP 500 far more often than small ones
+MAX_BATCH_SIZE = 25
+
+# Rows waiting to be written; a full queue makes downloaders wait for the writer
+ROW_QUEUE_SIZE = 64
+_END_OF_ROWS = object()
+
+# Doc metadata and exported content from previous runs, so unchanged docs
+# are not exported again
+METADATA_CACHE_FILE = 'metadata.sqlite'
+
+# Overlap between incremental listings, to allow for clock skew with Drive
+MODIFIED_AFTER_MARGIN = timedelta(minutes=5)
+
+# Content compresses well; level 3 keeps compression close to disk speed
+CONTENT_COMPRESS_LEVEL = 3
+
+# Column layout of the two output files
+METADATA_FIELDS = ['folder', 'filename', 'file_id', 'created_date', 'modified_date', 'content_length']
+CONTENT_FIELDS = METADATA_FIELDS + ['content']
+
+# Partial-response field lists; only request what the CSV actually uses
+FOLDER_FIELDS = 'id, name, parents'
+DOC_FIELDS = 'id, name, parents, createdTime, modifiedTime'
+
+
+@functools.lru_cache(maxsize=1)
 def setup_credentials():
-    """Set up Google API credentials from service account key file"""
+    """Set up Google API credentials from service account key file, once per process"""
     try:
         credentials = service_account.Credentials.from_service_account_file(
             'service_account_key.json',
@@ -29,18 +112,207 @@ def setup_credentials():
         sys.exit(1)
 
 
+class TokenBucket:
+    """Thread-safe token bucket that paces requests to a steady rate"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _take(self, tokens):
+        """Take tokens if available and return 0, otherwise return how long to wait"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+    
+    def _slices(self, tokens):
+        """Split a cost into pieces that fit in the bucket, so big batches are paid in full"""
+        while tokens > 0:
+            piece = min(tokens, self.capacity)
+            yield piece
+            tokens -= piece
+    
+    def acquire(self, tokens=1):
+        """Block until the given number of tokens is available, then take them"""
+        for piece in self._slices(tokens):
+            while wait := self._take(piece):
+                time.sleep(wait)
+    
+    async def acquire_async(self, tokens=1):
+        """Wait without blocking the event loop until the tokens are available"""
+        for piece in self._slices(tokens):
+            while wait := self._take(piece):
+                await asyncio.sleep(wait)
+
+
+# Shared by every thread so the whole process stays within quota
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
+
+def escape_query_value(value):
+    """Escape a string for use inside single quotes in a Drive search query"""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def retry_delay(retry_after, attempt):
+    """Seconds to wait before retrying, honoring the server's Retry-After hint"""
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(2 ** attempt + random.random(), MAX_BACKOFF_SECONDS)
+
+
+def with_retry(call, max_tries=6, cost=1):
+    """Run a Drive API call, retrying transient errors with exponential backoff.
+
+    Each attempt first waits for `cost` requests' worth of rate limit tokens.
+    """
+    for attempt in range(max_tries):
+        rate_limiter.acquire(cost)
+        try:
+            return call()
+        except HttpError as e:
+            status = e.resp.status
+            if status not in RETRYABLE_STATUSES or attempt == max_tries - 1:
+                raise
+            
+            delay = retry_delay(e.resp.get('retry-after'), attempt)
+            print(f"Drive API returned {status}, retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_tries})")
+            time.sleep(delay)
+
+
+class Http2Transport:
+    """httplib2-compatible transport that sends requests through a shared httpx client"""
+    
+    def __init__(self, client):
+        self.client = client
+    
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        response = self.client.request(method, uri, content=body, headers=headers)
+        content = response.content
+        
+        # httpx has already decoded the body, so make the headers match it
+        # the way httplib2 does
+        info = {key: value for key, value in response.headers.items()
+                if key not in ('content-encoding', 'content-length')}
+        info['content-length'] = str(len(content))
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason_phrase
+        return resp, content
+    
+    def close(self):
+        # The client is shared across services; it lives for the whole run
+        pass
+
+
+class OrjsonModel(JsonModel):
+    """JsonModel that parses response bodies with orjson"""
+    
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # Non-JSON bodies are handed back as text, like JsonModel does
+            return super().deserialize(content)
+        if self._data_wrapper and isinstance(body, dict) and 'data' in body:
+            body = body['data']
+        return body
+
+
+def get_http2_client():
+    """Return the process-wide httpx client, creating it on first use"""
+    global _http2_client
+    with _http2_client_lock:
+        if _http2_client is None:
+            _http2_client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                timeout=HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=MAX_HTTP_CONNECTIONS)
+            )
+        return _http2_client
+
+
+def build_drive_service(credentials):
+    """Build a Drive v3 service from the discovery document bundled with the client"""
+    # static_discovery skips fetching discovery JSON from googleapis.com, so
+    # there is nothing left for the discovery cache to do
+    # Listing pages can be large, so parse them with orjson when it's available
+    model = OrjsonModel() if orjson is not None else None
+    
+    if httpx is None:
+        return build('drive', 'v3', credentials=credentials, model=model,
+                     static_discovery=True, cache_discovery=False)
+    
+    # Send listing and metadata requests over the shared httpx connection pool
+    http = AuthorizedHttp(credentials, http=Http2Transport(get_http2_client()))
+    return build('drive', 'v3', http=http, model=model,
+                 static_discovery=True, cache_discovery=False)
+
+
+@functools.lru_cache(maxsize=1)
+def get_service():
+    """Return the process-wide Drive service used for listing and metadata calls"""
+    return build_drive_service(setup_credentials())
+
+
+def get_thread_service(credentials):
+    """Return a Drive service bound to the current thread, for the thread-pool fallback"""
+    service = getattr(_thread_local, 'service', None)
+    if service is None:
+        service = build_drive_service(credentials)
+        _thread_local.service = service
+    return service
+
+
+def get_parent_names(service, folders):
+    """Look up the parent folder name of each folder using batched requests"""
+    parent_names = {}
+    
+    def callback(request_id, response, exception):
+        if exception is None:
+            parent_names[request_id] = response.get('name')
+    
+    # Larger batches make Drive return 500s, so keep them small
+    for start in range(0, len(folders), MAX_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        chunk = folders[start:start + MAX_BATCH_SIZE]
+        for folder in chunk:
+            batch.add(service.files().get(
+                fileId=folder['parents'][0],
+                fields='name',
+                supportsAllDrives=True
+            ), request_id=folder['id'])
+        try:
+            # Each request in a batch counts against quota separately
+            with_retry(batch.execute, cost=len(chunk))
+        except Exception as e:
+            print(f"Error looking up parent folders: {e}")
+    
+    return parent_names
+
+
 def find_folder_id(service, folder_name, parent_name=None):
     """Find the Google Drive folder ID by name and optional parent"""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder'"
+    query = f"name='{escape_query_value(folder_name)}' and mimeType='application/vnd.google-apps.folder'"
     
     try:
-        results = service.files().list(
+        results = with_retry(service.files().list(
             q=query,
             spaces='drive',
-            fields='files(id, name, parents)',
+            fields=f'files({FOLDER_FIELDS})',
             supportsAllDrives=True,
             includeItemsFromAllDrives=True
-        ).execute()
+        ).execute)
         
         folders = results.get('files', [])
         
@@ -49,18 +321,11 @@ def find_folder_id(service, folder_name, parent_name=None):
             
         # If parent name specified and multiple folders found, try to match parent
         if parent_name and len(folders) > 1:
-            for folder in folders:
-                if folder.get('parents'):
-                    try:
-                        parent = service.files().get(
-                            fileId=folder['parents'][0],
-                            fields='name',
-                            supportsAllDrives=True
-                        ).execute()
-                        if parent.get('name') == parent_name:
-                            return folder['id']
-                    except Exception:
-                        continue
+            candidates = [folder for folder in folders if folder.get('parents')]
+            parent_names = get_parent_names(service, candidates)
+            for folder in candidates:
+                if parent_names.get(folder['id']) == parent_name:
+                    return folder['id']
         
         # Return first folder found
         return folders[0]['id']
@@ -70,147 +335,741 @@ def find_folder_id(service, folder_name, parent_name=None):
         return None
 
 
-def export_google_doc_to_text(service, file_id):
-    """Export a Google Doc to plain text"""
+def export_google_doc_to_text(service, file_id, output_path):
+    """Export a Google Doc to a plain text file and return its path and size"""
     try:
         request = service.files().export_media(
             fileId=file_id,
             mimeType='text/plain'
         )
         
-        file_content = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_content, request)
+        # Write chunks straight to disk rather than buffering the whole doc
+        with open(output_path, 'wb') as f:
+            downloader = MediaIoBaseDownload(f, request)
+            
+            done = False
+            while not done:
+                status, done = with_retry(downloader.next_chunk)
         
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
+        return output_path, os.path.getsize(output_path)
         
-        file_content.seek(0)
-        text = file_content.read().decode('utf-8', errors='ignore')
-        return text.strip()
+    except Exception as e:
+        print(f"Error exporting file {file_id}: {str(e)}")
+        return None, 0
+
+
+async def get_access_token(credentials, token_lock, rejected_token=None):
+    """Return a valid OAuth access token, refreshing the credentials if needed.
+
+    Pass the token Drive just rejected to force a refresh; coroutines that
+    were rejected with the same token share a single refresh.
+    """
+    async with token_lock:
+        if not credentials.valid or (rejected_token and credentials.token == rejected_token):
+            # The refresh is a blocking HTTP call, so keep it off the event loop
+            await asyncio.to_thread(credentials.refresh, Request(httplib2.Http()))
+        return credentials.token
+
+
+async def export_google_doc_async(client, credentials, file_id, output_path, token_lock, max_tries=6):
+    """Export a Google Doc to a plain text file without blocking the event loop"""
+    url = DRIVE_EXPORT_URL.format(file_id=file_id)
+    rejected_token = None
+    refreshed = False
+    
+    try:
+        for attempt in range(max_tries):
+            await rate_limiter.acquire_async()
+            token = await get_access_token(credentials, token_lock, rejected_token)
+            headers = {'Authorization': f"Bearer {token}"}
+            
+            async with client.stream('GET', url, params={'mimeType': 'text/plain'},
+                                     headers=headers) as response:
+                status = response.status_code
+                if status == 401 and not refreshed and attempt < max_tries - 1:
+                    # The token expired or was revoked early; refresh it and retry once
+                    rejected_token = token
+                    refreshed = True
+                    continue
+                if status in RETRYABLE_STATUSES and attempt < max_tries - 1:
+                    delay = retry_delay(response.headers.get('retry-after'), attempt)
+                else:
+                    response.raise_for_status()
+                    
+                    # Write chunks straight to disk rather than buffering the whole doc
+                    with open(output_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                    return output_path, os.path.getsize(output_path)
+            
+            print(f"Drive API returned {status}, retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_tries})")
+            await asyncio.sleep(delay)
         
     except Exception as e:
         print(f"Error exporting file {file_id}: {str(e)}")
+    return None, 0
+
+
+def decode_exported_text(data):
+    """Decode an exported document the way the CSV stores it"""
+    return data.decode('utf-8', errors='ignore').strip()
+
+
+def read_exported_text(content_path):
+    """Read back an exported document, or an empty string if the export failed"""
+    if not content_path:
         return ""
+    with open(content_path, 'rb') as f:
+        return decode_exported_text(f.read())
 
 
-def get_files_in_folder(service, folder_id, folder_name=""):
-    """Get all Google Docs in a folder and its subfolders recursively"""
-    all_files = []
-    
+def find_shared_drive_id(service, drive_name):
+    """Find the shared drive ID by name"""
     try:
-        query = f"'{folder_id}' in parents"
-        results = service.files().list(
+        results = with_retry(service.drives().list(
+            q=f"name='{escape_query_value(drive_name)}'",
+            fields='drives(id, name)'
+        ).execute)
+        
+        drives = results.get('drives', [])
+        return drives[0]['id'] if drives else None
+        
+    except Exception as e:
+        print(f"Error finding shared drive: {e}")
+        return None
+
+
+def iter_all_files(service, query, fields, drive_id=None):
+    """Yield every file matching a query, following pagination"""
+    scope = {'corpora': 'drive', 'driveId': drive_id} if drive_id else {'corpora': 'allDrives'}
+    page_token = None
+    
+    while True:
+        results = with_retry(service.files().list(
             q=query,
-            fields='files(id, name, mimeType, createdTime, modifiedTime)',
+            fields=f'nextPageToken, files({fields})',
+            pageSize=1000,
+            pageToken=page_token,
             supportsAllDrives=True,
-            includeItemsFromAllDrives=True
-        ).execute()
+            includeItemsFromAllDrives=True,
+            **scope
+        ).execute)
+        
+        yield from results.get('files', [])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def get_folder_resolver(service, folder_id, drive_id=None):
+    """List every folder once and return a function giving a folder's path under folder_id"""
+    folders = iter_all_files(
+        service,
+        "mimeType='application/vnd.google-apps.folder' and trashed=false",
+        FOLDER_FIELDS,
+        drive_id
+    )
+    folder_map = {
+        folder['id']: (folder['name'], (folder.get('parents') or [None])[0])
+        for folder in folders
+    }
+    # Path of each folder relative to folder_id, or None if outside it
+    folder_paths = {folder_id: ""}
+    
+    def resolve_path(parent_id):
+        chain = []
+        current = parent_id
+        while current not in folder_paths:
+            if current not in folder_map:
+                path = None
+                break
+            chain.append(current)
+            current = folder_map[current][1]
+        else:
+            path = folder_paths[current]
+        
+        # Walk back down, filling in every folder we passed through
+        for node in reversed(chain):
+            if path is not None:
+                name = folder_map[node][0]
+                path = f"{path}/{name}" if path else name
+            folder_paths[node] = path
         
-        items = results.get('files', [])
+        # A parent missing from folder_map (e.g. not shared with us) leaves
+        # the chain empty, so it has no entry of its own
+        return folder_paths.get(parent_id)
+    
+    return resolve_path
+
+
+def get_files_in_folder(service, folder_id, drive_id=None, modified_after=None, resolve_path=None):
+    """Get all Google Docs in a folder and its subfolders, optionally only recently modified ones.
+
+    Returns None if the listing could not be completed.
+    """
+    all_files = []
+    
+    try:
+        # List every folder and doc once, then rebuild the tree locally
+        # instead of issuing one list call per subfolder. Pages are consumed
+        # as they arrive, so only the folder map and matching docs are kept
+        if resolve_path is None:
+            resolve_path = get_folder_resolver(service, folder_id, drive_id)
         
-        for item in items:
-            if item['mimeType'] == 'application/vnd.google-apps.document':
-                # It's a Google Doc
-                item['folder'] = folder_name
-                all_files.append(item)
-            elif item['mimeType'] == 'application/vnd.google-apps.folder':
-                # It's a subfolder - recurse into it
-                subfolder_name = f"{folder_name}/{item['name']}" if folder_name else item['name']
-                subfolder_files = get_files_in_folder(service, item['id'], subfolder_name)
-                all_files.extend(subfolder_files)
+        doc_query = "mimeType='application/vnd.google-apps.document' and trashed=false"
+        if modified_after:
+            doc_query += f" and modifiedTime > '{modified_after}'"
+        docs = iter_all_files(
+            service,
+            doc_query,
+            DOC_FIELDS,
+            drive_id
+        )
+        
+        for doc in docs:
+            parents = doc.get('parents')
+            if not parents:
+                continue
+            path = resolve_path(parents[0])
+            if path is not None:
+                doc['folder'] = path
+                all_files.append(doc)
                 
     except Exception as e:
         print(f"Error getting files from folder {folder_id}: {e}")
+        return None
     
     return all_files
 
 
-def process_documents(service, folder_id):
-    """Process all Google Docs in the folder and return CSV data"""
-    print("\nFinding all Google Docs...")
-    all_docs = get_files_in_folder(service, folder_id)
-    print(f"Found {len(all_docs)} Google Docs")
+def open_metadata_cache(cache_path=METADATA_CACHE_FILE):
+    """Open the SQLite metadata cache, creating its tables if needed"""
+    conn = sqlite3.connect(cache_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS docs (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            folder TEXT,
+            created_time TEXT,
+            modified_time TEXT,
+            content_length INTEGER,
+            content_sha TEXT,
+            content BLOB
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+    conn.commit()
+    return conn
+
+
+def get_cache_state(cache, key):
+    """Read a value saved by a previous run, or None"""
+    row = cache.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_cache_state(cache, key, value):
+    """Save a value for the next run"""
+    cache.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+    cache.commit()
+
+
+def get_start_page_token(service, drive_id=None):
+    """Get the Drive changes token marking the current point in time"""
+    try:
+        kwargs = {'driveId': drive_id} if drive_id else {}
+        response = with_retry(service.changes().getStartPageToken(
+            supportsAllDrives=True,
+            **kwargs
+        ).execute)
+        return response.get('startPageToken')
+    except Exception as e:
+        print(f"Error getting changes token: {e}")
+        return None
+
+
+def list_changes(service, page_token, drive_id=None):
+    """List every change in the drive since the given token, or None on error"""
+    kwargs = {'driveId': drive_id} if drive_id else {}
+    changes = []
     
-    if not all_docs:
-        print("No Google Docs found!")
-        return []
+    try:
+        while page_token:
+            response = with_retry(service.changes().list(
+                pageToken=page_token,
+                pageSize=1000,
+                fields=f'nextPageToken, changes(fileId, removed, file(mimeType, trashed, {DOC_FIELDS}))',
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                **kwargs
+            ).execute)
+            changes.extend(response.get('changes', []))
+            page_token = response.get('nextPageToken')
+        return changes
+    except Exception as e:
+        print(f"Error checking for changes: {e}")
+        return None
+
+
+def load_cached_docs(cache):
+    """Rebuild the doc listing from the metadata cache"""
+    rows = cache.execute(
+        "SELECT id, name, folder, created_time, modified_time FROM docs"
+    ).fetchall()
+    return [
+        {'id': id, 'name': name, 'folder': folder,
+         'createdTime': created_time, 'modifiedTime': modified_time}
+        for id, name, folder, created_time, modified_time in rows
+    ]
+
+
+def list_documents(service, folder_id, cache, drive_id=None, update_cache=True):
+    """List docs in the folder, asking Drive only for what changed since the last run.
+
+    Returns the docs and the state to save once the run succeeds, or None
+    for the state if the listing was incomplete. With update_cache False the
+    cache is only read, never pruned.
+    """
+    previous_token = get_cache_state(cache, 'start_page_token')
+    last_run = get_cache_state(cache, 'last_run')
+    same_folder = get_cache_state(cache, 'folder_id') == folder_id
     
-    csv_data = []
-    total_docs = len(all_docs)
+    # Record the new token and run time before listing so changes made
+    # mid-run show up next time
+    run_started = datetime.now(timezone.utc) - MODIFIED_AFTER_MARGIN
+    new_state = {
+        'folder_id': folder_id,
+        'start_page_token': get_start_page_token(service, drive_id),
+        'last_run': run_started.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
     
-    for i, doc in enumerate(all_docs):
-        print(f"\nProcessing {i+1}/{total_docs}: {doc['name']}")
-        
-        # Export the document to text
-        text_content = export_google_doc_to_text(service, doc['id'])
+    changes = None
+    if previous_token and same_folder:
+        changes = list_changes(service, previous_token, drive_id)
+    
+    # Renaming or moving a folder changes the path of every doc under it
+    # without touching their modifiedTime, so only a full listing is safe
+    if changes and any(
+        change.get('file', {}).get('mimeType') == 'application/vnd.google-apps.folder'
+        for change in changes
+    ):
+        print("Folders changed since last run, doing a full listing")
+        changes = None
+    
+    def incomplete_listing():
+        # Keep the cache and saved state as they were, so nothing is pruned
+        # on a partial view and the next run lists again from the same point
+        print("Listing failed, falling back to the cached listing")
+        return load_cached_docs(cache), None
+    
+    def full_listing():
+        docs = get_files_in_folder(service, folder_id, drive_id)
+        if docs is None:
+            return incomplete_listing()
+        if not update_cache:
+            return docs, new_state
         
-        # Parse dates
-        created_date = doc['createdTime'][:10] if 'createdTime' in doc else ''
-        modified_date = doc['modifiedTime'][:10] if 'modifiedTime' in doc else ''
+        # Forget docs that were deleted or moved out of the folder
+        cache.execute("CREATE TEMP TABLE IF NOT EXISTS current_docs (id TEXT PRIMARY KEY)")
+        cache.execute("DELETE FROM current_docs")
+        cache.executemany("INSERT OR IGNORE INTO current_docs (id) VALUES (?)", [(doc['id'],) for doc in docs])
+        cache.execute("DELETE FROM docs WHERE id NOT IN (SELECT id FROM current_docs)")
+        cache.commit()
+        return docs, new_state
+    
+    if changes is None or not last_run:
+        # No usable history, so do a full listing
+        return full_listing()
+    
+    if not changes:
+        print("No Drive changes since last run, reusing cached listing")
+        return load_cached_docs(cache), new_state
+    
+    try:
+        resolve_path = get_folder_resolver(service, folder_id, drive_id)
+    except Exception as e:
+        print(f"Error listing folders: {e}")
+        return full_listing()
+    
+    # Overlay docs modified since the last run on the cached listing
+    docs = {doc['id']: doc for doc in load_cached_docs(cache)}
+    modified = get_files_in_folder(service, folder_id, drive_id, modified_after=last_run,
+                                   resolve_path=resolve_path)
+    if modified is None:
+        return incomplete_listing()
+    print(f"{len(modified)} Google Docs modified since {last_run}")
+    docs.update((doc['id'], doc) for doc in modified)
+    
+    # Moving a doc doesn't touch its modifiedTime either, so place every other
+    # changed doc by its current parent and drop the ones no longer in the folder
+    listed = {doc['id'] for doc in modified}
+    gone = []
+    for change in changes:
+        file = change.get('file') or {}
+        if change.get('removed') or file.get('trashed'):
+            gone.append(change['fileId'])
+            continue
+        if file.get('mimeType') != 'application/vnd.google-apps.document' or file['id'] in listed:
+            continue
         
-        # Add to CSV data
-        csv_data.append({
-            'folder': doc['folder'],
-            'filename': doc['name'],
-            'file_id': doc['id'],
-            'created_date': created_date,
-            'modified_date': modified_date,
-            'content_length': len(text_content),
-            'content': text_content
-        })
+        parents = file.get('parents')
+        path = resolve_path(parents[0]) if parents else None
+        if path is None:
+            gone.append(file['id'])
+        else:
+            docs[file['id']] = {**file, 'folder': path}
+    
+    for file_id in gone:
+        docs.pop(file_id, None)
+    if update_cache:
+        cache.executemany("DELETE FROM docs WHERE id = ?", [(file_id,) for file_id in gone])
+        cache.commit()
+    
+    return list(docs.values()), new_state
+
+
+def cache_rows(rows, cache_path=METADATA_CACHE_FILE):
+    """Record rows in the metadata cache as they pass through"""
+    # The writer thread needs its own connection
+    cache = open_metadata_cache(cache_path)
+    try:
+        for row in rows:
+            # One unreadable file or failed write must not stop the writer
+            try:
+                if row.get('cached'):
+                    # Content is unchanged, but the doc may have been renamed or moved
+                    cache.execute(
+                        "UPDATE docs SET name = ?, folder = ? WHERE id = ?",
+                        (row['filename'], row['folder'], row['file_id'])
+                    )
+                else:
+                    # Failed exports are kept in the listing but without content,
+                    # so the next run exports them again
+                    content = content_sha = None
+                    if row['content_path']:
+                        with open(row['content_path'], 'rb') as f:
+                            content = f.read()
+                        content_sha = hashlib.sha256(content).hexdigest()
+                        # Hand the text on so the CSV writer doesn't read the file again
+                        row['content'] = decode_exported_text(content)
+                        row['content_length'] = len(row['content'])
+                    cache.execute(
+                        "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (row['file_id'], row['filename'], row['folder'], row['created_time'],
+                         row['modified_time'], row['content_length'], content_sha, content)
+                    )
+            except Exception as e:
+                print(f"Error caching file {row['file_id']}: {e}")
+            yield row
+        cache.commit()
+    finally:
+        cache.close()
+
+
+def build_row(doc, content_path, content_length):
+    """Build a CSV row for a document and its exported text file"""
+    # Parse dates
+    created_date = doc['createdTime'][:10] if 'createdTime' in doc else ''
+    modified_date = doc['modifiedTime'][:10] if 'modifiedTime' in doc else ''
+    
+    return {
+        'folder': doc['folder'],
+        'filename': doc['name'],
+        'file_id': doc['id'],
+        'created_date': created_date,
+        'modified_date': modified_date,
+        'content_length': content_length,
+        'content_path': content_path,
+        'created_time': doc.get('createdTime', ''),
+        'modified_time': doc.get('modifiedTime', '')
+    }
+
+
+def export_document(credentials, doc, export_dir, row_queue):
+    """Export a single document using this thread's Drive service and queue its row"""
+    service = get_thread_service(credentials)
+    output_path = os.path.join(export_dir, f"{doc['id']}.txt")
+    content_path, content_length = export_google_doc_to_text(service, doc['id'], output_path)
+    row_queue.put(build_row(doc, content_path, content_length))
+
+
+def report_progress(processed, total_docs, doc):
+    """Print progress after a document finishes"""
+    print(f"\nProcessed {processed}/{total_docs}: {doc['name']}")
+    
+    # Show progress
+    if processed % 5 == 0:
+        print(f"Progress: {processed}/{total_docs} documents processed")
+
+
+def export_documents_threaded(docs, credentials, export_dir, row_queue, processed, total_docs):
+    """Export docs on a thread pool, one Drive service per thread"""
+    workers = min(MAX_EXPORT_WORKERS, len(docs))
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(export_document, credentials, doc, export_dir, row_queue): doc
+            for doc in docs
+        }
         
-        # Show progress
-        if (i + 1) % 5 == 0:
-            print(f"Progress: {i+1}/{total_docs} documents processed")
+        for future in as_completed(futures):
+            future.result()
+            processed += 1
+            report_progress(processed, total_docs, futures[future])
     
-    print(f"\nFinished processing {len(csv_data)} documents")
-    return csv_data
+    return processed
 
 
-def save_to_csv(csv_data):
-    """Save processed data to CSV files"""
-    if not csv_data:
-        print("No data to save!")
-        return None, None
+async def export_documents_async(docs, credentials, export_dir, row_queue, processed, total_docs):
+    """Export docs concurrently on one event loop over a shared HTTP/2 client"""
+    semaphore = asyncio.Semaphore(MAX_ASYNC_EXPORTS)
+    token_lock = asyncio.Lock()
     
-    # Create DataFrame
-    df = pd.DataFrame(csv_data)
+    async def export(client, doc):
+        async with semaphore:
+            output_path = os.path.join(export_dir, f"{doc['id']}.txt")
+            content_path, content_length = await export_google_doc_async(
+                client, credentials, doc['id'], output_path, token_lock
+            )
+        # A full queue means the writer is behind; wait off the event loop
+        await asyncio.to_thread(row_queue.put, build_row(doc, content_path, content_length))
+        return doc
     
-    # Show summary
-    print("\nDocument Summary:")
-    if len(df) > 0:
+    async with httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(max_connections=MAX_HTTP_CONNECTIONS)
+    ) as client:
+        for finished in asyncio.as_completed([export(client, doc) for doc in docs]):
+            doc = await finished
+            processed += 1
+            report_progress(processed, total_docs, doc)
+    
+    return processed
+
+
+def process_documents(all_docs, credentials, export_dir, row_queue, cache, content_required=True):
+    """Export the given Google Docs, putting a CSV row per document on the queue"""
+    processed = 0
+    total_docs = len(all_docs)
+    
+    if not content_required:
+        # Metadata only: skip exports and report lengths we already know,
+        # leaving them blank for docs edited since they were cached
+        cached_lengths = {
+            id: (modified_time, content_length)
+            for id, modified_time, content_length in cache.execute(
+                "SELECT id, modified_time, content_length FROM docs WHERE content_sha IS NOT NULL"
+            )
+        }
+        for doc in all_docs:
+            modified_time, content_length = cached_lengths.get(doc['id'], (None, None))
+            if not doc.get('modifiedTime') or modified_time != doc['modifiedTime']:
+                content_length = None
+            row_queue.put({**build_row(doc, None, content_length), 'cached': True})
+        return total_docs
+    
+    # Docs unchanged since the last run come straight from the cache
+    cached_times = dict(cache.execute(
+        "SELECT id, modified_time FROM docs WHERE content_sha IS NOT NULL"
+    ).fetchall())
+    to_export = []
+    for doc in all_docs:
+        if doc.get('modifiedTime') and cached_times.get(doc['id']) == doc['modifiedTime']:
+            content, content_length = cache.execute(
+                "SELECT content, content_length FROM docs WHERE id = ?", (doc['id'],)
+            ).fetchone()
+            output_path = os.path.join(export_dir, f"{doc['id']}.txt")
+            with open(output_path, 'wb') as f:
+                f.write(content)
+            row_queue.put({**build_row(doc, output_path, content_length), 'cached': True})
+            processed += 1
+        else:
+            to_export.append(doc)
+    
+    if processed:
+        print(f"Reused {processed} unchanged documents from cache")
+    if not to_export:
+        return processed
+    
+    # Exports are network-bound, so run them concurrently; asyncio when
+    # httpx is available, otherwise a thread pool
+    if httpx is not None:
+        processed = asyncio.run(export_documents_async(
+            to_export, credentials, export_dir, row_queue, processed, total_docs
+        ))
+    else:
+        processed = export_documents_threaded(
+            to_export, credentials, export_dir, row_queue, processed, total_docs
+        )
+    
+    print(f"\nFinished processing {processed} documents")
+    return processed
+
+
+def drain_queue(row_queue):
+    """Yield rows from the queue until the end-of-rows marker"""
+    while True:
+        row = row_queue.get()
+        if row is _END_OF_ROWS:
+            return
+        yield row
+
+
+def export_to_csv(all_docs, credentials, export_dir, cache, content_required=True):
+    """Export documents and write them to CSV at the same time"""
+    row_queue = queue.Queue(maxsize=ROW_QUEUE_SIZE)
+    result = [None, None, 0]
+    
+    ended = threading.Event()
+    
+    def rows_until_end():
+        yield from drain_queue(row_queue)
+        ended.set()
+    
+    def write_rows():
         try:
-            summary = df.groupby('folder').agg({
-                'filename': 'count',
-                'content_length': ['mean', 'sum']
-            }).round(0)
-            print(summary)
+            rows = rows_until_end()
+            # Metadata-only runs leave the cache untouched
+            if content_required:
+                rows = cache_rows(rows)
+            result[:] = save_to_csv(rows, content_required)
         except Exception as e:
-            print(f"Could not generate summary: {e}")
+            print(f"Error writing CSV files: {e}")
+            # The failed generators are finished, so read the queue directly
+            # until the end marker; downloaders must never block on a full queue
+            if not ended.is_set():
+                for _ in drain_queue(row_queue):
+                    pass
     
-    # Save full content CSV
-    csv_filename = 'fathom_docs_content.csv'
-    df.to_csv(csv_filename, index=False, encoding='utf-8')
-    print(f"\nSaved to {csv_filename}")
-    
-    # Preview the data (without full content)
-    if len(df) > 0:
-        preview_df = df[['folder', 'filename', 'created_date', 'content_length']].head(10)
-        print("\nPreview of documents:")
-        print(preview_df)
+    # A single writer thread consumes rows while the export pool produces them
+    writer = threading.Thread(target=write_rows)
+    writer.start()
+    try:
+        process_documents(all_docs, credentials, export_dir, row_queue, cache, content_required)
+    finally:
+        row_queue.put(_END_OF_ROWS)
+        writer.join()
     
-    # Create metadata-only version
-    metadata_df = df[['folder', 'filename', 'file_id', 'created_date', 'modified_date', 'content_length']]
+    return tuple(result)
+
+
+def print_summary(folder_totals):
+    """Print document count and content length per folder"""
+    print("\nDocument Summary:")
+    print(f"{'folder':<40} {'count':>8} {'mean_length':>12} {'total_length':>13}")
+    partial = False
+    for folder, (count, known, total_length) in sorted(folder_totals.items()):
+        # Lengths are unknown for docs that weren't exported (metadata-only
+        # runs), so the mean covers known lengths only and partial totals are starred
+        mean_length = round(total_length / known) if known else ''
+        total = total_length if known else ''
+        if 0 < known < count:
+            total = f"{total_length}*"
+            partial = True
+        print(f"{folder or '(root)':<40} {count:>8} {mean_length:>12} {total:>13}")
+    if partial:
+        print("* content length unknown for some docs; totals and means cover the rest")
+
+
+def save_to_csv(rows, content_required=True):
+    """Stream processed rows to CSV files and return the filenames and row count"""
+    csv_filename = 'fathom_docs_content.csv.gz' if content_required else None
     metadata_filename = 'fathom_docs_metadata.csv'
-    metadata_df.to_csv(metadata_filename, index=False)
     
-    print(f"\nCreated files: {csv_filename} and {metadata_filename}")
-    return csv_filename, metadata_filename
+    # folder -> [document count, docs with a known length, total content length]
+    folder_totals = defaultdict(lambda: [0, 0, 0])
+    preview_rows = []
+    row_count = 0
+    
+    # Write to temporary names and only replace the previous files once rows
+    # were written, so an empty or failed run leaves the committed CSV alone
+    filenames = [filename for filename in (csv_filename, metadata_filename) if filename]
+    temp_filenames = {filename: f"{filename}.tmp" for filename in filenames}
+    
+    # Write each row as it arrives so contents are never all held in memory
+    try:
+        with ExitStack() as stack:
+            metadata_file = stack.enter_context(open(temp_filenames[metadata_filename], 'w',
+                                                     newline='', encoding='utf-8'))
+            metadata_writer = csv.DictWriter(metadata_file, fieldnames=METADATA_FIELDS,
+                                             quoting=csv.QUOTE_MINIMAL, extrasaction='ignore')
+            metadata_writer.writeheader()
+            
+            content_writer = None
+            if content_required:
+                content_file = stack.enter_context(gzip.open(
+                    temp_filenames[csv_filename], 'wt', newline='', encoding='utf-8',
+                    compresslevel=CONTENT_COMPRESS_LEVEL
+                ))
+                content_writer = csv.DictWriter(content_file, fieldnames=CONTENT_FIELDS,
+                                                quoting=csv.QUOTE_MINIMAL, extrasaction='ignore')
+                content_writer.writeheader()
+            
+            for row in rows:
+                if content_writer:
+                    # content_length is the length of the text written to the CSV,
+                    # not the size of the raw export
+                    text = row.pop('content', None)
+                    if text is None:
+                        text = read_exported_text(row['content_path'])
+                    row['content_length'] = len(text)
+                    content_writer.writerow({**row, 'content': text})
+                metadata_writer.writerow(row)
+                
+                totals = folder_totals[row['folder']]
+                totals[0] += 1
+                if row['content_length'] is not None:
+                    totals[1] += 1
+                    totals[2] += row['content_length']
+                if len(preview_rows) < 10:
+                    preview_rows.append(row)
+                row_count += 1
+        
+        if row_count:
+            for filename in filenames:
+                os.replace(temp_filenames[filename], filename)
+    finally:
+        for temp_filename in temp_filenames.values():
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+    
+    if not row_count:
+        print("No data to save!")
+        return None, None, 0
+    
+    print_summary(folder_totals)
+    print(f"\nSaved to {csv_filename or metadata_filename}")
+    
+    # Preview the data (without full content)
+    print("\nPreview of documents:")
+    print(f"{'folder':<30} {'filename':<40} {'created_date':<12} {'content_length':>14}")
+    for row in preview_rows:
+        content_length = '' if row['content_length'] is None else row['content_length']
+        print(f"{row['folder']:<30} {row['filename']:<40} {row['created_date']:<12} {content_length:>14}")
+    
+    created = [filename for filename in (csv_filename, metadata_filename) if filename]
+    print(f"\nCreated files: {' and '.join(created)}")
+    return csv_filename, metadata_filename, row_count
+
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Export Google Docs from the Fathom folder to CSV")
+    parser.add_argument(
+        '--metadata-only',
+        action='store_true',
+        help="only refresh the metadata CSV; skip exporting document content"
+    )
+    return parser.parse_args()
 
 
 def main():
     """Main execution function"""
+    args = parse_args()
+    content_required = not args.metadata_only
+    
     # Configuration from environment variables
     project_id = os.environ.get('PROJECT_ID', '')
     bucket_name = os.environ.get('BUCKET_NAME', '')
@@ -223,11 +1082,17 @@ def main():
     print(f"  Project: {project_id}")
     print(f"  Bucket: {bucket_name}")
     print(f"  Looking for: {shared_drive_name}/{folder_path}")
+    print(f"  Mode: {'full export' if content_required else 'metadata only'}")
     print("=" * 50)
     
     # Set up credentials and API service
     credentials = setup_credentials()
-    service = build('drive', 'v3', credentials=credentials)
+    service = get_service()
+    
+    # Scope listings to the shared drive so we don't scan everything visible
+    drive_id = find_shared_drive_id(service, shared_drive_name)
+    if not drive_id:
+        print(f"Could not find shared drive {shared_drive_name}, searching all drives")
     
     # Find the target folder
     print("\nSearching for Fathom folder...")
@@ -248,21 +1113,40 @@ def main():
     
     print(f"Found Fathom folder with ID: {fathom_folder_id}")
     
-    # Process all documents
-    csv_data = process_documents(service, fathom_folder_id)
+    cache = open_metadata_cache()
     
-    if not csv_data:
+    print("\nFinding all Google Docs...")
+    all_docs, new_state = list_documents(service, fathom_folder_id, cache, drive_id,
+                                         update_cache=content_required)
+    print(f"Found {len(all_docs)} Google Docs")
+    
+    if not all_docs:
+        print("No Google Docs found!")
+    
+    with tempfile.TemporaryDirectory() as export_dir:
+        # Process all documents, writing each one out as it finishes
+        csv_filename, metadata_filename, row_count = export_to_csv(
+            all_docs, credentials, export_dir, cache, content_required
+        )
+    
+    if not row_count:
         print("No documents processed!")
         sys.exit(1)
     
-    # Save to CSV files
-    csv_filename, metadata_filename = save_to_csv(csv_data)
-    
-    if csv_filename and metadata_filename:
-        print(f"\nSuccess! Created {len(csv_data)} document exports")
+    if metadata_filename and (csv_filename or not content_required):
+        # Only trust the cached listing next time if this run exported everything;
+        # metadata-only runs leave the cache as it was
+        if content_required and new_state:
+            for key, value in new_state.items():
+                if value:
+                    set_cache_state(cache, key, value)
+        cache.close()
+        
+        print(f"\nSuccess! Created {row_count} document exports")
         print(f"Files created:")
-        print(f"  - {csv_filename}")
-        print(f"  - {metadata_filename}")
+        for filename in (csv_filename, metadata_filename):
+            if filename:
+                print(f"  - {filename}")
     else:
         print("Failed to create CSV files!")
         sys.exit(1)